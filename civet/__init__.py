@@ -21,5 +21,6 @@ __all__ = [
     'memoization',
     'abstract_data',
     'memoization',
-    'shells'
+    'shells',
+    'disk_cache'
 ]
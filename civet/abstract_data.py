@@ -3,7 +3,7 @@ Abstraction of command-line programs which produce data files.
 """
 import abc
 from os import PathLike
-from typing import Sequence, Union
+from typing import Sequence, Union, Optional
 
 
 class AbstractDataCommand(abc.ABC):
@@ -18,6 +18,8 @@ class AbstractDataCommand(abc.ABC):
     [frozen dataclasses](https://docs.python.org/3/library/dataclasses.html#frozen-instances).
     """
 
+    __slots__ = ()
+
     @abc.abstractmethod
     def command(self, output: str | PathLike) -> Sequence[Union[str, PathLike, 'AbstractDataCommand']]:
         ...
@@ -28,3 +30,20 @@ class AbstractDataCommand(abc.ABC):
         Preferred output path suffix for this command.
         """
         return ''
+
+    @property
+    def estimated_cost(self) -> float:
+        """
+        Relative cost of running this command, used to prioritize the longest
+        chains of commands when running in parallel.
+        """
+        return 1.0
+
+    @property
+    def passthrough(self) -> Optional[Union[str, PathLike, 'AbstractDataCommand']]:
+        """
+        If this command would only copy an input file or the output of another
+        command, that input. `civet.memoization.Memoizer` uses it in place of
+        the output of this command, without running anything.
+        """
+        return None
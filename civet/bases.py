@@ -2,15 +2,16 @@
 Base classes for file types.
 """
 import abc
+import os
 from os import PathLike
-from typing import Sequence, TypeVar, Generic, Callable
+from typing import Sequence, TypeVar, Generic, Callable, Hashable, Optional
 from dataclasses import dataclass
 from civet.abstract_data import AbstractDataCommand
 from civet.memoization import Session
 from civet.shells import Shell, subprocess_run
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class DataSource(AbstractDataCommand, abc.ABC):
     """
     A `DataSource` provides the `DataSource.save` method to `civet.abstract_data.AbstractDataCommand`,
@@ -18,7 +19,9 @@ class DataSource(AbstractDataCommand, abc.ABC):
     """
     def save(self, output: str | PathLike,
              require_output: bool = True,
-             shell: Shell = subprocess_run) -> None:
+             shell: Shell = subprocess_run,
+             max_workers: Optional[int] = 1,
+             as_script: bool = False) -> None:
         r"""
         Save the result of this command to the given output path.
 
@@ -39,15 +42,19 @@ class DataSource(AbstractDataCommand, abc.ABC):
                 sp.run(cmd, stdout=log_file, stderr=sp.STDOUT, check=True)
             GenericSurface('input.obj').slide_left().save('lefter.obj', shell=saves_log_shell)
         ```
+
+        If `max_workers` is greater than 1, or `None` to use all CPUs, independent
+        branches of the pipeline are run in parallel. If `as_script` is True, the
+        commands are run as bash scripts. See `civet.memoization.Memoizer`.
         """
-        with Session(require_output, shell) as s:
+        with Session(require_output, shell, max_workers=max_workers, as_script=as_script) as s:
             s.save(self, output)
 
 
 _D = TypeVar('_D', bound='DataFile')
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class DataFile(DataSource, Generic[_D], abc.ABC):
     """
     A `DataFile` represents a file type. It can wrap input files of that file type,
@@ -57,14 +64,114 @@ class DataFile(DataSource, Generic[_D], abc.ABC):
     input: str | PathLike | AbstractDataCommand
 
     def command(self, output: str | PathLike) -> Sequence[str | PathLike | AbstractDataCommand]:
-        return 'cp', self.input, output
+        if isinstance(self.input, AbstractDataCommand):
+            return 'cp', self.input, output
+        # input files are only read, so there is no need to copy them
+        return 'ln', '-s', os.path.abspath(self.input), output
+
+    @property
+    def passthrough(self) -> Optional[str | PathLike | AbstractDataCommand]:
+        if type(self).command is not DataFile.command:
+            return None
+        # the result of a command is named with the command's preferred suffix
+        name = self.input.preferred_suffix if isinstance(self.input, AbstractDataCommand) else str(self.input)
+        if name.endswith(self.preferred_suffix):
+            return self.input
+        # the copy is needed to give the file its preferred suffix
+        return None
 
     def create_command(self, command: Callable[[str | PathLike], Sequence[str | PathLike | AbstractDataCommand]]
                        ) -> _D:
         """
         Chain a command which produces output of the same type as this `DataFile`.
+
+        The returned object compares equal to any other object created by
+        calling `create_command` with the same function (or a closure of the
+        same code over equal values) on an equal `DataFile`. This way, building
+        the same step twice, e.g. `mask.minccalc_u8('out=1')` in two branches
+        of a pipeline, produces only one entry in `civet.memoization.Memoizer`.
         """
-        class Intermediate(self.__class__):
+        # chained steps subclass the original type, not the previous Intermediate
+        base = getattr(self, '_create_command_key', (self.__class__,))[0]
+        key = _command_key(command, self)
+
+        class Intermediate(base):
+            __slots__ = ('_hash',)
+
             def command(self, output: str | PathLike) -> Sequence[str | PathLike | AbstractDataCommand]:
                 return command(output)
-        return Intermediate(self)
+
+            def __eq__(self, other):
+                # compare the chains of inputs in a loop, so that long chains do not hit the recursion limit
+                a, b = self, other
+                while a is not b:
+                    a_key = getattr(a, '_create_command_key', None)
+                    if a_key is None:
+                        return a == b
+                    if getattr(b, '_create_command_key', None) != a_key or a._hash != b._hash:
+                        return False
+                    a, b = a.input, b.input
+                return True
+
+            def __hash__(self):
+                return self._hash
+
+        Intermediate._create_command_key = (base, key)
+        intermediate = Intermediate(self)
+        # the hash of the parent is already cached, so this does not recurse
+        object.__setattr__(intermediate, '_hash', hash((base, key, self)))
+        return intermediate
+
+
+_PARENT = object()
+"""
+Placeholder for the `DataFile` which `create_command` was called on, which is
+already part of the key as the `input` of the new object.
+"""
+
+
+def _command_key(command: Callable, parent: 'DataFile') -> Hashable:
+    """
+    Identify a command function by its code, the values it closes over and its
+    default arguments, so that two closures created by the same method with the
+    same arguments are interchangeable. Falls back to the identity of `command`
+    if it is not a plain function, or if any of those values are unhashable.
+    """
+    code = getattr(command, '__code__', None)
+    if code is None:
+        return command
+    values = []
+    for cell in command.__closure__ or ():
+        try:
+            values.append(cell.cell_contents)
+        except ValueError:  # empty cell
+            return command
+    values.extend(command.__defaults__ or ())
+    kwdefaults = sorted((command.__kwdefaults__ or {}).items())
+    values.extend(value for _, value in kwdefaults)
+    for i, value in enumerate(values):
+        if value is parent:
+            values[i] = _PARENT
+        elif not _is_hashable(value):
+            return command
+    return code, tuple(values), tuple(name for name, _ in kwdefaults)
+
+
+def _is_hashable(value) -> bool:
+    """
+    Check whether `value` can be hashed, without hashing `AbstractDataCommand`
+    (which are hashable by contract, but recursively so: hashing one means
+    hashing its whole dependency tree).
+    """
+    if isinstance(value, (str, int, float, AbstractDataCommand)):
+        return True
+    if isinstance(value, tuple):
+        for v in value:
+            if not _is_hashable(v):
+                return False
+        return True
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
@@ -0,0 +1,138 @@
+"""
+Persistent storage of intermediate results across sessions.
+
+By default, `civet.memoization.Memoizer` only caches results for the
+lifetime of a `civet.memoization.Session`. A `DiskCache` keeps them
+around in a directory, so that running the same pipeline again on the
+same input files skips the steps which have not changed.
+
+The disk cache is opt-in, either by passing a `DiskCache` to
+`civet.memoization.Session` or by setting the environment variable
+`PYCIVET_CACHE_DIR`. Optionally, `PYCIVET_CACHE_MAX_SIZE` (in bytes)
+limits the size of the cache, which is trimmed by evicting the least
+recently used results.
+"""
+
+import os
+import shutil
+import threading
+from dataclasses import dataclass
+from os import PathLike
+from pathlib import Path
+from typing import Optional, Iterable
+
+
+@dataclass(frozen=True, slots=True)
+class DiskCache:
+    """
+    A directory of results named by the digest of the command which produced them.
+    """
+
+    directory: Path
+    max_size: Optional[int] = None
+    """
+    Maximum total size of the cache in bytes, enforced by `DiskCache.trim`.
+    """
+
+    @classmethod
+    def from_env(cls) -> Optional['DiskCache']:
+        """
+        Create a `DiskCache` configured by the environment variables
+        `PYCIVET_CACHE_DIR` and `PYCIVET_CACHE_MAX_SIZE`, or `None` if
+        `PYCIVET_CACHE_DIR` is not set.
+        """
+        directory = os.environ.get('PYCIVET_CACHE_DIR')
+        if not directory:
+            return None
+        max_size = os.environ.get('PYCIVET_CACHE_MAX_SIZE')
+        return cls(Path(directory), int(max_size) if max_size else None)
+
+    def get(self, digest: str, suffix: str = '') -> Optional[Path]:
+        """
+        Get the path of a previously stored result, or `None` if not found.
+        """
+        path = self.directory / (digest + suffix)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, digest: str, suffix: str, result: Path) -> Path:
+        """
+        Move `result` into the cache and return its new path.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / (digest + suffix)
+        # move to a hidden name first so that other processes never see a partial result
+        staging = self.directory / f'.{digest}.{os.getpid()}.{threading.get_ident()}{suffix}'
+        shutil.move(result, staging)
+        try:
+            os.replace(staging, path)
+        except OSError:
+            if not path.exists():
+                raise
+            _remove(staging)
+        return path
+
+    def trim(self) -> None:
+        """
+        Delete the least recently used results until the size of the cache
+        is no greater than `max_size`.
+        """
+        if self.max_size is None or not self.directory.is_dir():
+            return
+        entries = [
+            (e.stat().st_mtime_ns, _size(e), Path(e.path))
+            for e in os.scandir(self.directory)
+            if not e.name.startswith('.')
+        ]
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            _remove(path)
+            total -= size
+
+
+def digest(parts: Iterable[str | bytes]) -> str:
+    """
+    Hash the given parts of a command.
+    """
+    import hashlib  # only needed if the disk cache is enabled
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        h.update(len(part).to_bytes(8, 'little'))
+        h.update(part)
+    return h.hexdigest()
+
+
+def fingerprint(path: str | PathLike) -> Optional[str]:
+    """
+    Identify the current version of a file by its location, size and
+    modification time. Returns `None` if `path` is not an existing file.
+    """
+    try:
+        st = os.stat(path)
+    except (OSError, ValueError):
+        return None
+    return f'{os.path.realpath(path)}:{st.st_size}:{st.st_mtime_ns}'
+
+
+def _size(entry: os.DirEntry) -> int:
+    if not entry.is_dir(follow_symlinks=False):
+        return entry.stat(follow_symlinks=False).st_size
+    return sum(
+        os.lstat(os.path.join(root, f)).st_size
+        for root, _, files in os.walk(entry.path)
+        for f in files
+    )
+
+
+def _remove(path: Path) -> None:
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
@@ -19,6 +19,7 @@ class HemisphereMask(GenericMask['HemisphereMask']):
     """
     Represents a binary mask of a brain hemisphere (either left or right).
     """
+    __slots__ = ()
 
     def just_sphere_mesh(self, side: Optional[Side] = None, subsample: bool = False) -> IrregularSurface:
         """
@@ -82,7 +83,7 @@ class HemisphereMask(GenericMask['HemisphereMask']):
             return initial_model
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class SphereMeshMask:
     """
     Represents a mask which is suitable input to the `sphere_mesh` program.
@@ -98,6 +99,8 @@ class SphereMeshMask:
 
     def sphere_mesh(self, subsample: bool = False) -> IrregularSurface:
         class SphereMeshSurface(IrregularSurface):
+            __slots__ = ()
+
             def command(self, output: str | PathLike
                         ) -> Sequence[str | PathLike | AbstractDataCommand]:
                 if subsample:
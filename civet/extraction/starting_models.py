@@ -12,6 +12,8 @@ class SurfaceModel(RegularSurface['SurfaceModel']):
     """
     Represents a surface data file from the `$MNI_DATAPATH/surface-extraction` directory.
     """
+    __slots__ = ()
+
     @classmethod
     def get_model(cls, name: str) -> Optional['SurfaceModel']:
         data_paths = MNI_DATAPATH.split(':')
@@ -16,7 +16,7 @@ _IS = TypeVar('_IS', bound='GenericIrregularSurface')
 _RS = TypeVar('_RS', bound='GenericRegularSurface')
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Tetra(DataSource):
 
     center: tuple[float, float, float] = (0.0, 0.0, 0.0)
@@ -39,6 +39,8 @@ class RegularSurface(GenericSurface[_RS], Generic[_RS]):
     polygonal mesh of *N* triangles where 320 and 4 are common
     denominators of *N*.
     """
+    __slots__ = ()
+
     @classmethod
     def create_tetra(cls, tetra: Tetra) -> 'RegularSurface[RegularSurface]':
         return cls(tetra)
@@ -48,6 +50,8 @@ class IrregularSurface(GenericSurface[_IS], Generic[_IS]):
     """
     Represents a mesh (`.obj`) with irregular connectivity.
     """
+    __slots__ = ()
+
     def interpolate_with_sphere(
             self,
             side: Optional[Side] = None,
@@ -69,6 +73,8 @@ class IrregularSurface(GenericSurface[_IS], Generic[_IS]):
             options += ['-inflate', str(n_inflate), str(n_smooth)]
 
         class InterpolatedFromSphere(RegularSurface):
+            __slots__ = ()
+
             def command(self, output: str | PathLike
                         ) -> Sequence[str | PathLike | AbstractDataCommand]:
                 return 'interpolate_surface_with_sphere.pl', *options, self.input, output
@@ -2,17 +2,31 @@
 Manual control of memoization features.
 """
 
+import heapq
+import itertools
+import os
+import shlex
+import shutil
+import threading
+from concurrent.futures import Future, wait, FIRST_COMPLETED
 from dataclasses import dataclass, field
 from os import PathLike
 from pathlib import Path
-from tempfile import NamedTemporaryFile, TemporaryDirectory
-from typing import ContextManager, Sequence, Callable, NewType
+from tempfile import TemporaryDirectory, mkdtemp
+from typing import ContextManager, Sequence, Callable, NewType, Optional, Iterator
 
 from civet.abstract_data import AbstractDataCommand
+from civet.disk_cache import DiskCache, digest, fingerprint
 from civet.shells import Shell, subprocess_run
 
 _IntermediatePath = NewType('IntermediatePath', Path)
 
+_OUTPUT_PLACEHOLDER = Path('{output}')
+"""
+Passed as the output path to `civet.abstract_data.AbstractDataCommand.command`
+when computing the digest of a command.
+"""
+
 
 @dataclass(frozen=True)
 class Memoizer:
@@ -29,47 +43,298 @@ class Memoizer:
     These nested objects are dependencies which need to be computed first.
     Hence, `AbstractDataCommand` can be thought of as
     nodes of a *dependency tree* where the root is the desired output and the
-    leaves are input files. `Memoizer` performs DFS on the tree, executing
-    the commands represented by each node, to produce the intermediate outputs
-    necessary to compute the root.
+    leaves are input files. `Memoizer` performs DFS on the tree to plan the
+    commands represented by each node in topological order, then executes them
+    to produce the intermediate outputs necessary to compute the root.
+    The DFS, like computing digests for the disk cache, is iterative, so long
+    chains of commands are not limited by Python's recursion limit.
+
+    ### Disk Cache
+
+    If `disk_cache` is given, results are also stored in a `civet.disk_cache.DiskCache`
+    keyed by a digest of their command, where nested `AbstractDataCommand` are
+    represented by their own digests and input files by their location, size and
+    modification time. Commands which do not depend on any other `AbstractDataCommand`
+    (such as copying an input file) are cheap and are not stored.
+
+    ### Parallelism
+
+    If `max_workers` is greater than 1, independent commands are run
+    concurrently in threads, running up to `max_workers` subprocesses at a time.
+    If `max_workers` is `None`, it is set to the number of CPUs. A dependency
+    shared by several branches is computed only once, also across threads
+    calling `save` concurrently.
+
+    ### Scripts
+
+    If `as_script` is True, the commands needed for each call to `save` are
+    written into a single bash script, which is run by one call to `shell`
+    instead of one call per command. `compile_to_script` returns such a
+    script without running it. If `max_workers` is greater than 1, each chain
+    of commands where every output is only used by the next command is run as
+    one script instead, so that independent branches still run in parallel.
+
+    ### Direct Output
+
+    If `direct_output` is True, a command given to `save` which is not cached yet
+    writes its output to the path given to `save` directly, instead of to the
+    temporary directory followed by a copy. Its result is then not cached,
+    since the file belongs to the caller, so saving the same command again will
+    run it again. The command writes to a temporary directory next to the output
+    path, and its result is moved to the output path only if it succeeds, so that
+    an existing file is neither lost on failure nor seen by programs which refuse
+    to overwrite their output. Commands without dependencies, such as
+    linking an input file, and outputs which are directories, are still copied.
+
+    ### Copy-on-Write
+
+    If `reflink` is True, results are copied with `cp --reflink=auto`, which clones
+    the data of files on filesystems which support it instead of copying their
+    bytes. It is a GNU coreutils option, so it must be supported by the `cp`
+    run by `shell` (and by the host running scripts from `compile_to_script`).
     """
 
     temp_dir: Path
     shell: Shell
     require_output: bool = True
+    disk_cache: Optional[DiskCache] = None
+    max_workers: Optional[int] = 1
+    as_script: bool = False
+    direct_output: bool = False
+    reflink: bool = False
     _cache: dict[AbstractDataCommand, _IntermediatePath] = field(init=False, default_factory=dict)
+    _digests: dict[AbstractDataCommand, tuple[str, bool]] = field(init=False, default_factory=dict)
+    _counter: Iterator[int] = field(init=False, default_factory=itertools.count)
+    _pending: dict[AbstractDataCommand, Future] = field(init=False, default_factory=dict)
+    _lock: threading.Lock = field(init=False, default_factory=threading.Lock)
+    _slots: threading.Semaphore = field(init=False)
+
+    def __post_init__(self):
+        if self.max_workers is None:
+            object.__setattr__(self, 'max_workers', os.cpu_count() or 1)
+        if self.max_workers < 1:
+            raise ValueError(f'max_workers {self.max_workers} < 1')
+        object.__setattr__(self, '_slots', threading.BoundedSemaphore(self.max_workers))
 
     def save(self, d: AbstractDataCommand, output: str | PathLike) -> None:
         """
         If `d` was previously computed, copy the cached result to `output`.
         Else, compute `d`, cache the result, and copy to `output`.
         """
-        if d not in self._cache:
-            self._force_save(d)
-        self.shell(('cp', '-r', self._cache[d], output))
+        if self.direct_output and self._save_directly(d, Path(output)):
+            return
+        self.shell((*self._copy_command(), self._cache_hit(d), output))
+
+    def _save_directly(self, d: AbstractDataCommand, output: Path) -> bool:
+        """
+        Compute `d` with its output next to `output`, then move it to `output` (see `direct_output`).
+        Returns False if the result of `d` should be copied to `output` instead, in which case
+        it might have been computed and cached.
+
+        Like `_cache_hit`, `d` is claimed so that other threads wait for it instead of
+        computing it again. They are given `output` as its result.
+        """
+        if d.passthrough is not None or os.path.isdir(output):
+            return False
+        with self._lock:
+            if d in self._cache or d in self._pending:
+                return False
+            claim = self._pending[d] = Future()
+        try:
+            result = self._force_save_directly(d, output)
+        except BaseException as e:
+            claim.set_exception(e)
+            raise
+        else:
+            claim.set_result(self._cache[d] if result is None else result)
+        finally:
+            with self._lock:
+                del self._pending[d]
+        return result is not None
+
+    def _force_save_directly(self, d: AbstractDataCommand, output: Path) -> Optional[_IntermediatePath]:
+        """
+        Compute `d` and move its result to `output`. If `d` is in the disk cache or its
+        command has no dependencies, compute and cache it as usual and return `None` instead.
+
+        Commands without dependencies are excluded, since they include commands which link
+        their input files to their output: writing to `output` later would modify the input.
+        """
+        _, stored = self._from_disk_cache(d)
+        if stored is not None:
+            self._cache[d] = stored
+            return None
+        # the old output is only replaced if the command succeeds, and programs
+        # which refuse to overwrite existing files do not see it
+        partial_dir = Path(mkdtemp(prefix=f'.{output.name}.', dir=output.parent))
+        try:
+            # like the cache of this Memoizer, the disk cache must not take the file of the caller
+            plan = self._plan(d, None, output=_IntermediatePath(partial_dir / output.name))
+            root = plan[-1]
+            if any(isinstance(c, AbstractDataCommand) for c in root.cmd):
+                root.cached = False
+            else:
+                root.output = self.__temp(d.preferred_suffix)
+                root.cmd = d.command(root.output)
+            self._run(plan)
+            if root.cached:
+                return None
+            try:
+                os.replace(root.output, output)
+            except FileNotFoundError:
+                if self.require_output:
+                    raise
+        finally:
+            shutil.rmtree(partial_dir, ignore_errors=True)
+        return _IntermediatePath(output)
+
+    def compile_to_script(self, d: AbstractDataCommand, output: str | PathLike) -> str:
+        """
+        Get a bash script which does the same as `save(d, output)`, without running anything.
+
+        Intermediate results are written to the temporary directory of this `Memoizer`,
+        and results which are already cached are reused, so the script is only valid
+        for the lifetime of the `Session`. Running the script does not add its
+        results to the cache.
+        """
+        if (result := self._cache.get(d)) is None:
+            key, _ = self._from_disk_cache(d)
+            script, result = self._script(self._plan(d, key))
+        else:
+            script = ''
+        return script + shlex.join((*self._copy_command(), os.fspath(result), os.fspath(output))) + '\n'
+
+    def _copy_command(self) -> tuple[str, ...]:
+        """
+        Command which copies results to the output paths given to `save`.
+        """
+        return ('cp', '-rL', '--reflink=auto') if self.reflink else ('cp', '-rL')
 
     def _force_save(self, d: AbstractDataCommand) -> _IntermediatePath:
         """
         Compute `d` and cache the result.
         """
-        output = self.__temp(d.preferred_suffix)
-        cmd = self._resolve_command(d.command(output))
-        self.shell(cmd)
-        if self.require_output and not output.exists():
+        if (source := d.passthrough) is not None:
+            return self._alias(d, source)
+        key, stored = self._from_disk_cache(d)
+        if stored is not None:
+            self._cache[d] = stored
+            return stored
+        return self._schedule(d, key)
+
+    def _execute(self, d: AbstractDataCommand, output: _IntermediatePath,
+                 cmd: Sequence[str | PathLike], key: Optional[str], cached: bool = True) -> _IntermediatePath:
+        """
+        Run the resolved command `cmd` of `d` and cache the result.
+        """
+        with self._slots:
+            self.shell(cmd)
+        return self._finish(d, output, key, cached)
+
+    def _finish(self, d: AbstractDataCommand, output: _IntermediatePath, key: Optional[str],
+                cached: bool = True) -> _IntermediatePath:
+        """
+        Check and cache the result of `d` after its command has been run.
+        If `cached` is False, the result is only checked.
+        """
+        # a single stat, only if anything needs it
+        exists = (self.require_output or key is not None) and output.exists()
+        if self.require_output and not exists:
             print(f'output is: {output}')
             self.shell(('ls', self.temp_dir))
             raise NoOutputError(d)
+        if key is not None and exists:
+            output = _IntermediatePath(self.disk_cache.put(key, d.preferred_suffix, output))
+        if cached:
+            self._cache[d] = output
+        return output
+
+    def _alias(self, d: AbstractDataCommand, source: str | PathLike | AbstractDataCommand) -> _IntermediatePath:
+        """
+        Cache the result of `d` to be the input it passes through.
+        """
+        output = _IntermediatePath(Path(self._resolve_component(source)))
+        if self.require_output and not output.exists():
+            raise NoOutputError(d)
         self._cache[d] = output
         return output
 
+    def _from_disk_cache(self, d: AbstractDataCommand) -> tuple[Optional[str], Optional[_IntermediatePath]]:
+        """
+        Look up `d` in the disk cache. Returns the key which the result of `d`
+        should be stored under (`None` if it should not be stored), and the path
+        to the stored result if found.
+        """
+        if self.disk_cache is None:
+            return None, None
+        key, is_leaf = self._digest(d)
+        if is_leaf:
+            return None, None
+        stored = self.disk_cache.get(key, d.preferred_suffix)
+        return key, None if stored is None else _IntermediatePath(stored)
+
+    def _digest(self, d: AbstractDataCommand) -> tuple[str, bool]:
+        """
+        Compute the digest of `d` for the disk cache, and whether `d` is a leaf
+        (has no dependencies on other `AbstractDataCommand`).
+        """
+        # postorder DFS using a stack, so that long chains do not hit the recursion limit
+        commands: dict[AbstractDataCommand, Sequence[str | PathLike | AbstractDataCommand]] = {}
+        stack = [d]
+        while stack:
+            node = stack[-1]
+            if node in self._digests:
+                stack.pop()
+                continue
+            cmd = commands.get(node)
+            if cmd is None:
+                cmd = commands[node] = node.command(_OUTPUT_PLACEHOLDER)
+                missing = [c for c in cmd if isinstance(c, AbstractDataCommand) and c not in self._digests]
+                if missing:
+                    stack.extend(missing)
+                    continue
+            stack.pop()
+            parts = [node.preferred_suffix]
+            is_leaf = True
+            for c in cmd:
+                if c is _OUTPUT_PLACEHOLDER:
+                    parts.append(b'\0output')
+                elif isinstance(c, AbstractDataCommand):
+                    parts.append(b'\0command:' + self._digests[c][0].encode())
+                    is_leaf = False
+                elif (fp := fingerprint(c)) is not None:
+                    parts.append(b'\0file:' + fp.encode())
+                else:
+                    parts.append(str(c))
+            self._digests[node] = digest(parts), is_leaf
+        return self._digests[d]
+
     def _cache_hit(self, d: AbstractDataCommand) -> _IntermediatePath:
         """
         If `d` was previously computed, return the path to its cached result.
         Else, compute `d` first and then return the path to its cached result.
+
+        If `d` is being computed by another thread, wait for it to finish.
         """
-        if d in self._cache:
-            return self._cache[d]
-        return self._force_save(d)
+        with self._lock:
+            if (result := self._cache.get(d)) is not None:
+                return result
+            claim = Future()
+            future = self._pending.setdefault(d, claim)
+            is_owner = future is claim
+        if not is_owner:
+            return future.result()
+        try:
+            result = self._force_save(d)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                del self._pending[d]
+        return result
 
     def _resolve_command(self, cmd: Sequence[str | PathLike | AbstractDataCommand]) -> Sequence[str | PathLike]:
         """
@@ -86,13 +351,323 @@ class Memoizer:
         # TODO subshell support
         raise TypeError(f'{c} is not a [str | PathLike | AbstractDataCommand]')
 
+    def _schedule(self, root: AbstractDataCommand, key: Optional[str]) -> _IntermediatePath:
+        """
+        Compute `root` and its dependencies.
+
+        If `max_workers > 1`, commands are started as soon as their dependencies are
+        ready. When there are more ready commands than `max_workers`, the ones on the longest path
+        to `root` (by `civet.abstract_data.AbstractDataCommand.estimated_cost`)
+        go first.
+        """
+        self._run(self._plan(root, key))
+        return self._cache[root]
+
+    def _run(self, plan: list['_Step']) -> None:
+        """
+        Run `plan`, letting other threads waiting for its steps know if it fails.
+        """
+        try:
+            self._run_plan(plan)
+        except BaseException as e:
+            for step in plan:
+                step.release(self, exception=e)
+            raise
+
+    def _plan(self, root: AbstractDataCommand, key: Optional[str],
+              output: Optional[_IntermediatePath] = None) -> list['_Step']:
+        """
+        Find the dependencies of `root` which need to be computed, in topological order
+        (`root` is last), with their longest path weights.
+
+        Dependencies are not claimed while planning, only right before they are run
+        (see `_acquire`). `root` is claimed by the caller.
+        """
+        steps = {root: _Step(root, key, output=output, claimed=True)}
+        stack = [steps[root]]
+        while stack:
+            step = stack.pop()
+            if step.wait_for is not None:
+                continue
+            if step.output is None:
+                step.output = self.__temp(step.data.preferred_suffix)
+            step.cmd = step.data.command(step.output)
+            for c in step.cmd:
+                if not isinstance(c, AbstractDataCommand):
+                    continue
+                dependency = steps.get(c)
+                if dependency is None:
+                    dependency = self._new_step(c)
+                    if dependency is None:
+                        continue
+                    steps[c] = dependency
+                    stack.append(dependency)
+                if dependency not in step.inputs:
+                    step.inputs.append(dependency)
+                    dependency.consumers.append(step)
+
+        # Kahn's algorithm, starting from root and going towards the leaves
+        remaining = {step: len(step.consumers) for step in steps.values()}
+        order = [steps[root]]
+        for step in order:
+            longest = max((consumer.weight for consumer in step.consumers), default=0.0)
+            step.weight = step.data.estimated_cost + longest
+            for dependency in step.inputs:
+                remaining[dependency] -= 1
+                if remaining[dependency] == 0:
+                    order.append(dependency)
+        order.reverse()
+        return order
+
+    def _new_step(self, d: AbstractDataCommand) -> Optional['_Step']:
+        """
+        Create a `_Step` for computing dependency `d`, or `None` if its result is already available.
+        """
+        with self._lock:
+            if d in self._cache:
+                return None
+            if (pending := self._pending.get(d)) is not None:
+                return _Step(d, wait_for=pending)
+        key, stored = (None, None) if d.passthrough is not None else self._from_disk_cache(d)
+        if stored is not None:
+            self._cache[d] = stored
+            return None
+        return _Step(d, key)
+
+    def _acquire(self, steps: list['_Step']) -> Optional[Future]:
+        """
+        Claim the given steps which are not computed yet, all at once. If any of them
+        is being computed by another thread, claim nothing and return its future instead.
+
+        Claims are only made when the inputs of the steps are ready, so that a thread
+        never holds a claim on a step while waiting for another thread, which could
+        be waiting for that step.
+        """
+        with self._lock:
+            unclaimed = [step for step in steps if not step.claimed and step.data not in self._cache]
+            for step in unclaimed:
+                if (future := self._pending.get(step.data)) is not None:
+                    return future
+            for step in unclaimed:
+                self._pending[step.data] = Future()
+                step.claimed = step.owns_pending = True
+        return None
+
+    def _acquire_when_free(self, steps: list['_Step']) -> None:
+        """
+        Wait for other threads computing any of `steps`, then claim the rest of them.
+        """
+        for step in steps:
+            if step.wait_for is not None:
+                step.wait_for.result()
+        while (future := self._acquire([step for step in steps if step.wait_for is None])) is not None:
+            future.result()
+
+    def _run_plan(self, plan: list['_Step']) -> None:
+        """
+        Run the commands of `plan` using a pool of `max_workers` threads,
+        or as a single script if `as_script` is True.
+        """
+        if self.max_workers == 1:
+            if self.as_script:
+                self._acquire_when_free(plan)
+                self._run_script(plan)
+                return
+            for step in plan:
+                self._acquire_when_free([step])
+                self._run_step(step)
+            return
+        from concurrent.futures import ThreadPoolExecutor  # only needed if max_workers > 1
+        chains = self._chains(plan)
+        chain_of = {step: chain for chain in chains for step in chain}
+        # only the first step of a chain depends on steps outside of it
+        remaining = {id(chain): len(chain[0].inputs) for chain in chains}
+        tiebreaker = itertools.count()
+        ready = [(-chain[0].weight, next(tiebreaker), chain) for chain in chains if not chain[0].inputs]
+        heapq.heapify(ready)
+        run = self._run_script if self.as_script else self._run_chain
+        # futures of chains submitted to the pool, and of other threads computing a step of a chain
+        running: dict[Future, list[_Step]] = {}
+        submitted: set[Future] = set()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while ready or running:
+                while ready and len(submitted) < self.max_workers:
+                    _, _, chain = heapq.heappop(ready)
+                    other = chain[0].wait_for if chain[0].wait_for is not None else self._acquire(chain)
+                    if other is not None:
+                        # waiting for another thread does not occupy a worker
+                        running[other] = chain
+                        continue
+                    future = executor.submit(run, chain)
+                    running[future] = chain
+                    submitted.add(future)
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    chain = running.pop(future)
+                    future.result()
+                    if future in submitted:
+                        submitted.remove(future)
+                    elif chain[0].wait_for is None:
+                        # try again to claim the steps which are still not computed
+                        heapq.heappush(ready, (-chain[0].weight, next(tiebreaker), chain))
+                        continue
+                    for consumer in chain[-1].consumers:
+                        consumer_chain = chain_of[consumer]
+                        remaining[id(consumer_chain)] -= 1
+                        if remaining[id(consumer_chain)] == 0:
+                            heapq.heappush(ready, (-consumer.weight, next(tiebreaker), consumer_chain))
+
+    def _chains(self, plan: list['_Step']) -> list[list['_Step']]:
+        """
+        Group the steps of `plan` into chains, which are run as units by `_run_plan`.
+
+        If `as_script` is True, a step is appended to the chain of its input if it has
+        only one input and that input is not used by any other step. Otherwise, every
+        step is its own chain.
+        """
+        chains: list[list[_Step]] = []
+        chain_of: dict[_Step, list[_Step]] = {}
+        for step in plan:
+            if (
+                    self.as_script
+                    and step.wait_for is None
+                    and len(step.inputs) == 1
+                    and step.inputs[0].wait_for is None
+                    and len(step.inputs[0].consumers) == 1
+            ):
+                chain = chain_of[step.inputs[0]]
+                chain.append(step)
+            else:
+                chain = [step]
+                chains.append(chain)
+            chain_of[step] = chain
+        return chains
+
+    def _run_step(self, step: '_Step') -> None:
+        """
+        Compute `step` if it was claimed by `_acquire`, else its result was already computed.
+        """
+        if not step.claimed:
+            return
+        if (source := step.data.passthrough) is not None:
+            result = self._alias(step.data, source)
+        else:
+            result = self._execute(step.data, step.output, self._resolve_command(step.cmd), step.key, step.cached)
+        step.release(self, result=result)
+
+    def _run_chain(self, chain: list['_Step']) -> None:
+        for step in chain:
+            self._run_step(step)
+
+    def _run_script(self, plan: list['_Step']) -> None:
+        """
+        Run the claimed steps of `plan` as a script.
+        """
+        script, _ = self._script(plan)
+        if script:
+            # passed as a file, since a single argument is limited to 128 KiB on Linux
+            script_path = self.__temp('.sh')
+            script_path.write_text(script)
+            with self._slots:
+                self.shell(('bash', '-eu', script_path))
+        for step in plan:
+            if not step.claimed:
+                continue
+            if (source := step.data.passthrough) is not None:
+                result = self._alias(step.data, source)
+            else:
+                result = self._finish(step.data, step.output, step.key, step.cached)
+            step.release(self, result=result)
+
+    def _script(self, plan: list['_Step']) -> tuple[str, _IntermediatePath]:
+        """
+        Write the commands of `plan` as lines of a shell script, using the output
+        paths planned for each command as the inputs of the commands which depend
+        on them. Returns the script and the path of the last command's result.
+        """
+        planned: dict[AbstractDataCommand, _IntermediatePath] = {}
+
+        def path_of(c: str | PathLike | AbstractDataCommand) -> _IntermediatePath:
+            if not isinstance(c, AbstractDataCommand):
+                return _IntermediatePath(Path(c))
+            planned_path = planned.get(c)
+            return self._cache[c] if planned_path is None else planned_path
+
+        lines = []
+        for step in plan:
+            if step.wait_for is not None:
+                planned[step.data] = step.wait_for.result()
+            elif not step.claimed and step.data in self._cache:
+                planned[step.data] = self._cache[step.data]
+            elif (source := step.data.passthrough) is not None:
+                planned[step.data] = path_of(source)
+            else:
+                cmd = (path_of(c) if isinstance(c, AbstractDataCommand) else c for c in step.cmd)
+                lines.append(shlex.join(map(os.fspath, cmd)) + '\n')
+                planned[step.data] = step.output
+        return ''.join(lines), planned[plan[-1].data]
+
     def __temp(self, suffix='') -> _IntermediatePath:
         """
         Create a temporary path name.
+
+        Names are only unique within `temp_dir`, which is private to this `Memoizer`,
+        so there is no need to create (and delete) a file to reserve them.
         """
-        with NamedTemporaryFile(suffix=suffix, dir=self.temp_dir) as t:
-            pass
-        return _IntermediatePath(Path(t.name))
+        return _IntermediatePath(self.temp_dir / f'n{next(self._counter)}{suffix}')
+
+
+@dataclass(eq=False)
+class _Step:
+    """
+    A command in the plan of `Memoizer._schedule`.
+    """
+
+    data: AbstractDataCommand
+    key: Optional[str] = None
+    claimed: bool = False
+    """
+    Whether this step is computed by this thread. The root of a plan is always
+    claimed, other steps are claimed by `Memoizer._acquire`.
+    """
+    owns_pending: bool = False
+    """
+    Whether this step is registered as pending by `Memoizer._acquire`, so
+    that other threads wait for it.
+    """
+    wait_for: Optional[Future] = None
+    """
+    If set, `data` is being computed by another thread.
+    """
+    output: Optional[_IntermediatePath] = None
+    cached: bool = True
+    """
+    Whether the result is added to the cache of the `Memoizer`. False for a result which
+    is moved to the output path given to `Memoizer.save` (see `direct_output`).
+    """
+    cmd: Sequence[str | PathLike | AbstractDataCommand] = ()
+    inputs: list['_Step'] = field(default_factory=list)
+    consumers: list['_Step'] = field(default_factory=list)
+    weight: float = 0.0
+    """
+    Total estimated cost of this command and the commands which depend on it, along
+    the longest path to the root.
+    """
+
+    def release(self, memoizer: Memoizer, result: Optional[_IntermediatePath] = None,
+                exception: Optional[BaseException] = None) -> None:
+        """
+        Let other threads waiting for this step know it is done.
+        """
+        if not self.owns_pending:
+            return
+        self.owns_pending = False
+        with memoizer._lock:
+            future = memoizer._pending.pop(self.data)
+        if exception is None:
+            future.set_result(result)
+        else:
+            future.set_exception(exception)
 
 
 @dataclass(frozen=True)
@@ -108,15 +683,45 @@ class Session(ContextManager[Memoizer]):
     shell: Shell = subprocess_run
     """
     A function which executes its parameters as a subprocess.
+    If `max_workers > 1`, it must be thread-safe.
     """
     temp_dir: ContextManager[str] = field(default_factory=TemporaryDirectory)
+    """
+    A directory for intermediate files. It must not be shared with anything else.
+    """
+    disk_cache: Optional[DiskCache] = field(default_factory=DiskCache.from_env)
+    """
+    Persistent cache of results. By default, it is configured by the environment variable
+    `PYCIVET_CACHE_DIR`. See `civet.disk_cache`.
+    """
+    max_workers: Optional[int] = 1
+    """
+    Maximum number of subprocesses to run in parallel, or `None` to use the number of CPUs.
+    """
+    as_script: bool = False
+    """
+    Run the commands of each `Memoizer.save` as a single bash script.
+    """
+    direct_output: bool = False
+    """
+    Write the result of each `Memoizer.save` directly to its output path, without caching it.
+    """
+    reflink: bool = False
+    """
+    Copy results to the output paths of `Memoizer.save` with `cp --reflink=auto` (GNU coreutils).
+    """
 
     def __enter__(self) -> Memoizer:
         temp_dir_name = self.temp_dir.__enter__()
-        return Memoizer(Path(temp_dir_name), require_output=self.require_output, shell=self.shell)
+        return Memoizer(Path(temp_dir_name), require_output=self.require_output, shell=self.shell,
+                        disk_cache=self.disk_cache, max_workers=self.max_workers,
+                        as_script=self.as_script, direct_output=self.direct_output,
+                        reflink=self.reflink)
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.temp_dir.__exit__(exc_type, exc_val, exc_tb)
+        if self.disk_cache is not None:
+            self.disk_cache.trim()
 
 
 class NoOutputError(Exception):
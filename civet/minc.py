@@ -12,8 +12,13 @@ from civet.xfm import TransformProgram, TransformableMixin
 _M = TypeVar('_M', bound='GenericMinc')
 _V = TypeVar('_V', bound='GenericMinc')
 
+_RESHAPE255_CMD = (
+    'mincreshape', '-quiet', '-clobber', '-unsigned', '-byte',
+    '-image_range', '0', '255', '-valid_range', '0', '255'
+)
 
-@dataclass(frozen=True)
+
+@dataclass(frozen=True, slots=True)
 class GenericMinc(TransformableMixin[_M], DataFile[_M], Generic[_M]):
 
     preferred_suffix = '.mnc'
@@ -29,11 +34,7 @@ class GenericMinc(TransformableMixin[_M], DataFile[_M], Generic[_M]):
 
     def reshape255(self) -> 'GenericMask':
         def command(output):
-            return (
-                'mincreshape', '-quiet', '-clobber', '-unsigned', '-byte',
-                '-image_range', '0', '255', '-valid_range', '0', '255',
-                self, output
-            )
+            return (*_RESHAPE255_CMD, self, output)
         return GenericMask(self).create_command(command)
 
     def resamplef64(self, *extra_flags: str) -> 'GenericFloatMinc':
@@ -46,20 +47,20 @@ class MincVolume(GenericMinc['MincVolume']):
     """
     A `MincVolume` represents a volume (`.mnc`).
     """
-    pass
+    __slots__ = ()
 
 
 _MA = TypeVar('_MA', bound='GenericMask')
 
 
 class GenericMask(GenericMinc[_MA], Generic[_MA]):
+    __slots__ = ()
 
     def dilate_volume(self, dilation_value: int, neighbors: Literal[6, 26], n_dilations: int) -> _MA:
+        args = (str(dilation_value), str(neighbors), str(n_dilations))
+
         def command(output):
-            return (
-                'dilate_volume', self, output,
-                str(dilation_value), str(neighbors), str(n_dilations)
-            )
+            return ('dilate_volume', self, output, *args)
         return self.create_command(command)
 
     def minccalc_u8(self, expression: str, *other_volumes: 'GenericMask') -> _MA:
@@ -73,11 +74,12 @@ class GenericMask(GenericMinc[_MA], Generic[_MA]):
         return self.create_command(command)
 
     def mincdefrag(self, label: int, stencil: Literal[6, 19, 27], max_connect: Optional[int] = None) -> _MA:
+        args = (str(label), str(stencil))
+        if max_connect is not None:
+            args += (str(max_connect),)
+
         def command(output):
-            cmd = ['mincdefrag', self, output, str(label), str(stencil)]
-            if max_connect is not None:
-                cmd.append(str(max_connect))
-            return cmd
+            return ('mincdefrag', self, output, *args)
         return self.create_command(command)
 
     def reshape_bbox(self) -> _MA:
@@ -101,20 +103,24 @@ class Mask(GenericMask['Mask']):
     """
     A `Mask` represents a volume (`.mnc`) with discrete intensities (segmentation volume or brain mask).
     """
-    pass
+    __slots__ = ()
 
 
 _F = TypeVar('_F', bound='GenericFloatMinc')
 
 
 class GenericFloatMinc(GenericMinc[_F], Generic[_F]):
+    __slots__ = ()
+
     def mincblur(self, fwhm: float) -> _F:
         # result is not a binary mask, it has float values in [0, 1],
         # maybe define a unique type?
+        fwhm_arg = str(fwhm)
+
         def command(output):
-            return 'mincblur_correct_name.sh', '-quiet', '-fwhm', str(fwhm), self, output
+            return 'mincblur_correct_name.sh', '-quiet', '-fwhm', fwhm_arg, self, output
         return self.create_command(command)
 
 
 class FloatMinc(GenericFloatMinc['FloatMinc']):
-    pass
+    __slots__ = ()
@@ -10,7 +10,7 @@ _S = TypeVar('_S', bound='GenericSurface')
 _M = TypeVar('_M', bound=GenericMask)
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class GenericSurface(TransformableMixin[_S], Generic[_S]):
     preferred_suffix: ClassVar[str] = '.obj'
     transform_program: ClassVar[str] = 'transform_objects'
@@ -21,9 +21,10 @@ class GenericSurface(TransformableMixin[_S], Generic[_S]):
         return in_volume.create_command(command)
 
     def adapt_object_mesh(self, target_points: int, n_iterations: int, n_adapt: int, n_adapt_smooth: int) -> _S:
+        args = (str(target_points), str(n_iterations), str(n_adapt), str(n_adapt_smooth))
+
         def command(output):
-            return 'adapt_object_mesh', self, output, \
-                str(target_points), str(n_iterations), str(n_adapt), str(n_adapt_smooth)
+            return ('adapt_object_mesh', self, output, *args)
         return self.create_command(command)
 
 
@@ -31,4 +32,4 @@ class Surface(GenericSurface['Surface']):
     """
     Represents a polygonal mesh of a brain surface in `.obj` file format.
     """
-    pass
+    __slots__ = ()
@@ -3,9 +3,15 @@ Wrappers around
 [`subprocess.run`](https://docs.python.org/3/library/subprocess.html#subprocess.run).
 """
 
+import os
+import selectors
+import shlex
 import subprocess as sp
+import threading
+from collections import deque
+from concurrent.futures import Future
 from os import PathLike
-from typing import Sequence, Callable
+from typing import Sequence, Callable, Optional
 
 Shell = Callable[[Sequence[str | PathLike]], None]
 
@@ -22,3 +28,236 @@ def quiet(cmd: Sequence[str | PathLike]) -> None:
     Similar to `subprocess_run` but output streams are piped to `/dev/null`.
     """
     sp.run(cmd, check=True, stdout=sp.DEVNULL, stderr=sp.STDOUT)
+
+
+class BatchRunner:
+    """
+    A thread-safe `Shell` which supervises all of its subprocesses from a
+    single dispatcher thread, running up to `max_parallel` of them at a time.
+
+    It is meant to be used with `civet.memoization.Session(max_workers=...)`,
+    where the calling threads only wait for their subprocess to finish:
+
+    ```python
+    from civet.memoization import Session
+    from civet.shells import BatchRunner
+
+    with BatchRunner(max_parallel=8) as shell, Session(shell=shell, max_workers=8) as s:
+        ...
+    ```
+
+    Finished subprocesses are detected by polling their
+    [pidfd](https://man7.org/linux/man-pages/man2/pidfd_open.2.html).
+    On platforms without `os.pidfd_open`, commands are run directly by
+    `subprocess_run` in the calling thread.
+    """
+
+    def __init__(self, max_parallel: int = os.cpu_count() or 1, quiet: bool = False):
+        if max_parallel < 1:
+            raise ValueError(f'max_parallel {max_parallel} < 1')
+        self.max_parallel = max_parallel
+        self.quiet = quiet
+        self._queue: deque[tuple[Sequence[str | PathLike], Future]] = deque()
+        self._lock = threading.Lock()
+        self._wake_r, self._wake_w = os.pipe()
+        # a full pipe already wakes up the dispatcher
+        os.set_blocking(self._wake_w, False)
+        self._dispatcher: Optional[threading.Thread] = None
+        self._closed = False
+
+    def __call__(self, cmd: Sequence[str | PathLike]) -> None:
+        if not hasattr(os, 'pidfd_open'):
+            return (quiet if self.quiet else subprocess_run)(cmd)
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('BatchRunner is closed')
+            self._queue.append((cmd, future))
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch, name='BatchRunner', daemon=True)
+                self._dispatcher.start()
+            # while holding the lock, so that close() cannot close the pipe first
+            self._wake()
+        future.result()
+
+    def close(self) -> None:
+        """
+        Wait for queued subprocesses to finish and stop the dispatcher thread.
+        """
+        with self._lock:
+            self._closed = True
+            dispatcher = self._dispatcher
+            self._wake()
+        if dispatcher is not None:
+            dispatcher.join()
+        with self._lock:
+            os.close(self._wake_r)
+            os.close(self._wake_w)
+
+    def _wake(self) -> None:
+        """
+        Wake up the dispatcher thread. Must be called while holding `self._lock`.
+        """
+        try:
+            os.write(self._wake_w, b'\0')
+        except BlockingIOError:
+            pass
+
+    def __enter__(self) -> 'BatchRunner':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _dispatch(self) -> None:
+        # subprocesses which have been started and whose future is not set yet
+        running: dict[Future, sp.Popen] = {}
+        with selectors.DefaultSelector() as selector:
+            selector.register(self._wake_r, selectors.EVENT_READ)
+            try:
+                self._supervise(selector, running)
+            except BaseException as e:
+                self._fail(selector, running, e)
+                raise
+
+    def _supervise(self, selector: selectors.BaseSelector, running: dict[Future, sp.Popen]) -> None:
+        """
+        Start queued subprocesses and wait for them until the `BatchRunner` is closed.
+        """
+        while True:
+            while len(running) < self.max_parallel and (job := self._next_job()) is not None:
+                self._start(selector, running, *job)
+            if not running:
+                with self._lock:
+                    if self._closed and not self._queue:
+                        return
+            for key, _ in selector.select():
+                if key.fileobj == self._wake_r:
+                    os.read(self._wake_r, 4096)
+                    continue
+                process, future = key.data
+                selector.unregister(key.fileobj)
+                os.close(key.fileobj)
+                process.wait()
+                self._finish(process, future)
+                del running[future]
+
+    def _fail(self, selector: selectors.BaseSelector, running: dict[Future, sp.Popen], e: BaseException) -> None:
+        """
+        Fail the futures of every queued and running subprocess with `e`, and refuse
+        new commands, since there is no dispatcher thread to run them anymore.
+        """
+        with self._lock:
+            self._closed = True
+            queued = [future for _, future in self._queue]
+            self._queue.clear()
+        for future in queued:
+            future.set_exception(e)
+        for key in list(selector.get_map().values()):
+            if key.fileobj != self._wake_r:
+                os.close(key.fileobj)
+        for future, process in running.items():
+            process.kill()
+            process.wait()
+            if not future.done():
+                future.set_exception(e)
+
+    def _next_job(self) -> Optional[tuple[Sequence[str | PathLike], Future]]:
+        with self._lock:
+            return self._queue.popleft() if self._queue else None
+
+    def _start(self, selector: selectors.BaseSelector, running: dict[Future, sp.Popen],
+               cmd: Sequence[str | PathLike], future: Future) -> None:
+        """
+        Start a subprocess and register it with `selector` and in `running`.
+        """
+        output = sp.DEVNULL if self.quiet else None
+        try:
+            process = sp.Popen(cmd, stdout=output, stderr=sp.STDOUT if self.quiet else None)
+        except Exception as e:
+            future.set_exception(e)
+            return
+        running[future] = process
+        try:
+            pidfd = os.pidfd_open(process.pid)
+        except OSError:
+            process.wait()
+            self._finish(process, future)
+            del running[future]
+            return
+        selector.register(pidfd, selectors.EVENT_READ, (process, future))
+
+    @staticmethod
+    def _finish(process: sp.Popen, future: Future) -> None:
+        if process.returncode == 0:
+            future.set_result(None)
+        else:
+            future.set_exception(sp.CalledProcessError(process.returncode, process.args))
+
+
+class PersistentBash:
+    """
+    A `Shell` which runs every command in one long-lived `bash` process,
+    instead of starting each of them from Python with `subprocess.run`.
+
+    Starting a subprocess from a large Python process is slower than from
+    `bash`, which matters for long pipelines of quick commands:
+
+    ```python
+    from civet.memoization import Session
+    from civet.shells import PersistentBash
+
+    with PersistentBash() as shell, Session(shell=shell) as s:
+        ...
+    ```
+
+    Commands are run one at a time, so there is no benefit to using it with
+    `civet.memoization.Session(max_workers=...)`. A failed command raises
+    `subprocess.CalledProcessError`, including when the program is not found
+    (exit status 127). If `bash` itself exits, `ChildProcessError` is raised.
+    """
+
+    def __init__(self, quiet: bool = False):
+        self.quiet = quiet
+        status_r, self._status_w = os.pipe()
+        self._process = sp.Popen(
+            ('bash',), stdin=sp.PIPE, text=True, pass_fds=(self._status_w,),
+            stdout=sp.DEVNULL if quiet else None, stderr=sp.STDOUT if quiet else None
+        )
+        os.close(self._status_w)
+        self._status = os.fdopen(status_r)
+        self._lock = threading.Lock()
+
+    def __call__(self, cmd: Sequence[str | PathLike]) -> None:
+        # stdin of the commands must not be the script itself, and the status pipe is only for bash
+        line = f'{shlex.join(map(os.fspath, cmd))} < /dev/null {self._status_w}>&-; echo $? >&{self._status_w}\n'
+        with self._lock:
+            if self._process.poll() is not None:
+                raise ChildProcessError('bash exited unexpectedly')
+            try:
+                self._process.stdin.write(line)
+                self._process.stdin.flush()
+            except BrokenPipeError as e:
+                raise ChildProcessError('bash exited unexpectedly') from e
+            status = self._status.readline()
+        if not status:
+            raise ChildProcessError('bash exited unexpectedly')
+        if int(status) != 0:
+            raise sp.CalledProcessError(int(status), cmd)
+
+    def close(self) -> None:
+        """
+        Stop the `bash` process.
+        """
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            pass  # bash already exited
+        self._process.wait()
+        self._status.close()
+
+    def __enter__(self) -> 'PersistentBash':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
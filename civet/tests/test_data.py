@@ -1,6 +1,12 @@
+import os
+from pathlib import Path
 from unittest.mock import Mock
 from pytest_mock import MockFixture
 from civet.bases import DataFile, DataSource
+from civet.disk_cache import DiskCache
+from civet.memoization import Session
+from civet.minc import Mask
+from civet.obj import Surface
 from dataclasses import dataclass, field
 
 
@@ -50,3 +56,159 @@ def test_uses_cache(mocker: MockFixture):
     another2_cache, = thing2.do_another_command.call_args.args
 
     shell.assert_any_call(('foo', something1_cache, mocker.ANY, another2_cache, mocker.ANY))
+
+
+@dataclass(frozen=True)
+class ExampleStep(DataFile['ExampleStep']):
+    def step(self, n: int) -> 'ExampleStep':
+        def command(output):
+            return 'step', self, str(n), output
+        return self.create_command(command)
+
+
+def test_equivalent_steps_are_deduplicated(mocker: MockFixture):
+    shell = mocker.Mock()
+    leaf = ExampleStep('dne')
+    assert leaf.step(1) == leaf.step(1)
+    assert hash(leaf.step(1)) == hash(leaf.step(1))
+    assert leaf.step(1) != leaf.step(2)
+    assert leaf.step(1).step(2) != leaf.step(2).step(1)
+
+    with Session(require_output=False, shell=shell) as s:
+        s.save(leaf.step(1).step(2), 'result1')
+        s.save(leaf.step(1).step(2), 'result2')
+
+    step_calls = [c for c in shell.call_args_list if c.args[0][0] == 'step']
+    assert len(step_calls) == 2
+
+
+def test_default_arguments_distinguish_steps(mocker: MockFixture):
+    shell = mocker.Mock()
+    leaf = ExampleStep('dne')
+    a, b = [leaf.create_command(lambda output, t=t: ('step', leaf, t, output)) for t in ('1', '2')]
+    assert a != b
+
+    with Session(require_output=False, shell=shell) as s:
+        s.save(a, 'a')
+        s.save(b, 'b')
+    step_calls = [c.args[0] for c in shell.call_args_list if c.args[0][0] == 'step']
+    assert [c[2] for c in step_calls] == ['1', '2']
+
+
+def test_long_chains_hash_without_recursion():
+    def chain(name: str) -> ExampleStep:
+        step = ExampleStep(name)
+        for _ in range(5000):
+            step = step.step(1)
+        return step
+
+    a = chain('a.txt')
+    b = chain('b.txt')
+    assert hash(a) != hash(b)
+    assert a != b
+    assert a == chain('a.txt')
+
+
+def test_equal_long_chains_are_deduplicated(mocker: MockFixture):
+    def chain() -> ExampleStep:
+        step = ExampleStep('input.txt')
+        for _ in range(3000):
+            step = step.step(1)
+        return step
+
+    shell = mocker.Mock()
+    with Session(require_output=False, shell=shell) as s:
+        s.save(chain(), 'output1')
+        s.save(chain(), 'output2')
+    assert sum(c.args[0][0] == 'step' for c in shell.call_args_list) == 3000
+
+
+def test_long_chains_digest_without_recursion(tmp_path: Path):
+    step = ExampleStep('input.txt')
+    for _ in range(5000):
+        step = step.step(1)
+    with Session(disk_cache=DiskCache(tmp_path)) as s:
+        script = s.compile_to_script(step, 'output.txt')
+    assert script.count('\n') == 5001
+
+
+def test_long_chains_as_script(tmp_path: Path):
+    # a script of 3000 commands is longer than the limit of a single argument
+    step = ExampleStep(tmp_path / 'input')
+    for _ in range(3000):
+        step = step.create_command(lambda output, previous=step: ('true', previous, output))
+    step = step.create_command(lambda output, previous=step: ('touch', previous, output))
+    with Session(require_output=False, as_script=True) as s:
+        s.save(step, tmp_path / 'output')
+    assert (tmp_path / 'output').exists()
+
+
+def test_input_file_is_linked():
+    assert ExampleStep('dne').command('output') == ('ln', '-s', os.path.abspath('dne'), 'output')
+    step = ExampleStep('dne').step(1)
+    assert ExampleStep(step).command('output') == ('cp', step, 'output')
+
+
+def test_reshape_bbox_runs_once_per_mask(mocker: MockFixture):
+    shell = mocker.Mock()
+    mask = Mask('dne.mnc')
+    with Session(require_output=False, shell=shell) as s:
+        s.save(mask.reshape_bbox().minccalc_u8('A[0]+A[1]', mask.reshape_bbox()), 'output.mnc')
+    helper_calls = [c for c in shell.call_args_list if c.args[0][0] == 'mincreshape_bbox_helper']
+    assert len(helper_calls) == 1
+
+
+def test_xfm_runs_once_per_session(mocker: MockFixture):
+    shell = mocker.Mock()
+    with Session(require_output=False, shell=shell) as s:
+        s.save(Surface('left.obj').slide_right(), 'left_slid.obj')
+        s.save(Surface('right.obj').slide_right().flip_x().flip_x(), 'right_slid.obj')
+    programs = [c.args[0][0] for c in shell.call_args_list]
+    assert programs.count('param2xfm') == 2
+    assert programs.count('transform_objects') == 2
+
+
+def test_chained_xfms_are_concatenated(mocker: MockFixture):
+    shell = mocker.Mock()
+    with Session(require_output=False, shell=shell) as s:
+        s.save(Surface('input.obj').flip_x().slide_right().slide_left(), 'output.obj')
+    calls = [c.args[0] for c in shell.call_args_list]
+    assert [c[0] for c in calls] == ['param2xfm'] * 3 + ['xfmconcat', 'transform_objects', 'cp']
+    left, right, scales, concat, transform, copy = calls
+    assert scales[1:5] == ('-scales', '-1', '1', '1')
+    assert right[1:5] == ('-translation', '25', '0', '0')
+    assert left[1:5] == ('-translation', '-25', '0', '0')
+    assert concat == ('xfmconcat', scales[-1], right[-1], left[-1], concat[-1])
+    assert transform == ('transform_objects', Path('input.obj'), concat[-1], transform[-1])
+    assert copy == ('cp', '-rL', transform[-1], 'output.obj')
+
+
+def test_direct_output_does_not_link_input(mocker: MockFixture):
+    shell = mocker.Mock()
+    with Session(require_output=False, shell=shell, direct_output=True) as s:
+        s.save(Mask('input.nii'), 'output.mnc')
+    link_call, cp_call = shell.call_args_list
+    assert link_call.args[0][:2] == ('ln', '-s')
+    assert link_call.args[0][-1] != Path('output.mnc')
+    assert cp_call.args[0][-1] == 'output.mnc'
+
+
+def test_command_input_is_copied_to_preferred_suffix(mocker: MockFixture):
+    shell = mocker.Mock()
+    step = ExampleStep('input').step(1)
+    with Session(require_output=False, shell=shell) as s:
+        s.save(Mask(step).reshape_bbox(), 'output.mnc')
+    step_call, cp_call, reshape_call, _ = shell.call_args_list
+    assert cp_call.args[0][:2] == ('cp', step_call.args[0][-1])
+    assert str(cp_call.args[0][-1]).endswith('.mnc')
+    assert reshape_call.args[0][1] == cp_call.args[0][-1]
+
+
+def test_passthrough_runs_nothing(mocker: MockFixture):
+    shell = mocker.Mock()
+    with Session(require_output=False, shell=shell) as s:
+        s.save(ExampleStep(ExampleStep('input').step(1)), 'output')
+    step_call, cp_call = shell.call_args_list
+    step_output = step_call.args[0][-1]
+    assert step_call.args[0] == ('step', Path('input'), '1', step_output)
+    assert cp_call.args[0] == ('cp', '-rL', step_output, 'output')
@@ -1,4 +1,11 @@
+import os
+import subprocess as sp
+import threading
+import time
+from pathlib import Path
+import pytest
 from pytest_mock import MockFixture
+from civet.disk_cache import DiskCache
 from civet.memoization import Session
 from civet.abstract_data import AbstractDataCommand
 
@@ -6,6 +13,7 @@ from civet.abstract_data import AbstractDataCommand
 def test_simple(mocker: MockFixture):
     mock_data = mocker.MagicMock(spec=AbstractDataCommand)
     mock_data.preferred_suffix = ''
+    mock_data.passthrough = None
     mock_data.command.return_value = ('one', 'two')
 
     shell = mocker.Mock()
@@ -16,7 +24,7 @@ def test_simple(mocker: MockFixture):
     cache_path, = mock_data.command.call_args.args
     expected = [
         mocker.call(('one', 'two')),
-        mocker.call(('cp', '-r', cache_path, 'output'))
+        mocker.call(('cp', '-rL', cache_path, 'output'))
     ]
     assert shell.call_args_list == expected
 
@@ -24,6 +32,7 @@ def test_simple(mocker: MockFixture):
 def test_reuses_cache(mocker: MockFixture):
     mock_data = mocker.MagicMock(spec=AbstractDataCommand)
     mock_data.preferred_suffix = ''
+    mock_data.passthrough = None
     mock_data.command.return_value = ('one', 'two')
 
     shell = mocker.Mock()
@@ -34,6 +43,371 @@ def test_reuses_cache(mocker: MockFixture):
     mock_data.command.assert_called_once()
     cache_path, = mock_data.command.call_args.args
     shell.assert_has_calls([
-        mocker.call(('cp', '-r', cache_path, 'output1')),
-        mocker.call(('cp', '-r', cache_path, 'output2'))
+        mocker.call(('cp', '-rL', cache_path, 'output1')),
+        mocker.call(('cp', '-rL', cache_path, 'output2'))
     ])
+
+
+def test_direct_output(mocker: MockFixture, tmp_path: Path):
+    leaf = mocker.MagicMock(spec=AbstractDataCommand)
+    leaf.preferred_suffix = ''
+    leaf.passthrough = None
+    leaf.command.side_effect = lambda output: ('leaf', output)
+    step = mocker.MagicMock(spec=AbstractDataCommand)
+    step.preferred_suffix = ''
+    step.passthrough = None
+    step.command.side_effect = lambda output: ('step', leaf, output)
+
+    shell = mocker.Mock(side_effect=lambda cmd: Path(cmd[-1]).write_text(cmd[0]))
+    with Session(shell=shell, direct_output=True) as s:
+        s.save(step, tmp_path / 'output1')
+        s.save(step, tmp_path / 'output2')
+
+    leaf.command.assert_called_once()
+    leaf_path, = leaf.command.call_args.args
+    leaf_call, *step_calls = [c.args[0] for c in shell.call_args_list]
+    assert leaf_call == ('leaf', leaf_path)
+    assert [c[:2] for c in step_calls] == [('step', leaf_path)] * 2
+    # written next to the output, then moved to it
+    assert [(c[2].parent.parent, c[2].name) for c in step_calls] == [(tmp_path, 'output1'), (tmp_path, 'output2')]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['output1', 'output2']
+    assert (tmp_path / 'output1').read_text() == 'step'
+
+
+def test_direct_output_replaces_file(mocker: MockFixture, tmp_path: Path):
+    leaf = mocker.MagicMock(spec=AbstractDataCommand)
+    leaf.preferred_suffix = ''
+    leaf.passthrough = None
+    leaf.command.side_effect = lambda output: ('leaf', output)
+    step = mocker.MagicMock(spec=AbstractDataCommand)
+    step.preferred_suffix = ''
+    step.passthrough = None
+    step.command.side_effect = lambda output: ('step', leaf, output)
+    output = tmp_path / 'output'
+    output.write_text('old')
+
+    def shell(cmd):
+        assert not Path(cmd[-1]).exists()
+        Path(cmd[-1]).write_text('new')
+
+    cache = DiskCache(tmp_path / 'cache')
+    with Session(shell=shell, direct_output=True, disk_cache=cache) as s:
+        s.save(step, output)
+    assert output.read_text() == 'new'
+    # nothing is stored in the disk cache, the leaf is not worth storing
+    assert list(tmp_path.iterdir()) == [output]
+
+
+def test_direct_output_keeps_file_on_failure(mocker: MockFixture, tmp_path: Path):
+    leaf = mocker.MagicMock(spec=AbstractDataCommand)
+    leaf.preferred_suffix = ''
+    leaf.passthrough = None
+    leaf.command.side_effect = lambda output: ('leaf', output)
+    step = mocker.MagicMock(spec=AbstractDataCommand)
+    step.preferred_suffix = ''
+    step.passthrough = None
+    step.command.side_effect = lambda output: ('step', leaf, output)
+    output = tmp_path / 'output'
+    output.write_text('old')
+
+    def shell(cmd):
+        if cmd[0] == 'step':
+            raise sp.CalledProcessError(1, cmd)
+        Path(cmd[-1]).write_text('new')
+
+    with Session(shell=shell, direct_output=True) as s:
+        with pytest.raises(sp.CalledProcessError):
+            s.save(step, output)
+    assert output.read_text() == 'old'
+    assert list(tmp_path.iterdir()) == [output]
+
+
+def test_concurrent_direct_outputs_run_once(mocker: MockFixture, tmp_path: Path):
+    step_running = threading.Event()
+    second_waiting = threading.Event()
+    leaf = mocker.MagicMock(spec=AbstractDataCommand)
+    leaf.preferred_suffix = ''
+    leaf.passthrough = None
+    leaf.command.side_effect = lambda output: ('leaf', output)
+    step = mocker.MagicMock(spec=AbstractDataCommand)
+    step.preferred_suffix = ''
+    step.passthrough = None
+    step.command.side_effect = lambda output: ('step', leaf, output)
+
+    def shell(cmd):
+        if cmd[0] == 'step':
+            step_running.set()
+            second_waiting.wait(timeout=5)
+        Path(cmd[-1]).write_text(cmd[0])
+    shell = mocker.Mock(side_effect=shell)
+
+    with Session(shell=shell, direct_output=True) as s:
+        first = threading.Thread(target=s.save, args=(step, tmp_path / 'output1'))
+        first.start()
+        step_running.wait(timeout=5)
+        # the second save waits for the first one, which is still running
+        second = threading.Thread(target=s.save, args=(step, tmp_path / 'output2'))
+        second.start()
+        time.sleep(0.1)
+        second_waiting.set()
+        first.join(timeout=5)
+        second.join(timeout=5)
+
+    assert not first.is_alive() and not second.is_alive()
+    programs = [c.args[0][0] for c in shell.call_args_list]
+    assert programs == ['leaf', 'step', 'cp']
+    assert shell.call_args_list[-1].args[0] == ('cp', '-rL', tmp_path / 'output1', tmp_path / 'output2')
+
+
+def test_disk_cache(mocker: MockFixture, tmp_path: Path):
+    input_file = tmp_path / 'input.txt'
+    input_file.write_text('hello')
+
+    leaf = mocker.MagicMock(spec=AbstractDataCommand)
+    leaf.preferred_suffix = '.txt'
+    leaf.passthrough = None
+    leaf.command.side_effect = lambda output: ('cp', input_file, output)
+    step = mocker.MagicMock(spec=AbstractDataCommand)
+    step.preferred_suffix = '.txt'
+    step.passthrough = None
+    step.command.side_effect = lambda output: ('step', leaf, output)
+
+    def touch_output(cmd):
+        Path(cmd[-1]).write_text(' '.join(map(str, cmd)))
+
+    cache = DiskCache(tmp_path / 'cache')
+
+    first_shell = mocker.Mock(side_effect=touch_output)
+    with Session(shell=first_shell, disk_cache=cache) as s:
+        s.save(step, tmp_path / 'output1.txt')
+    assert [c.args[0][0] for c in first_shell.call_args_list] == ['cp', 'step', 'cp']
+    assert len(list(cache.directory.iterdir())) == 1
+
+    second_shell = mocker.Mock(side_effect=touch_output)
+    with Session(shell=second_shell, disk_cache=cache) as s:
+        s.save(step, tmp_path / 'output2.txt')
+    cached, = cache.directory.iterdir()
+    second_shell.assert_called_once_with(('cp', '-rL', cached, tmp_path / 'output2.txt'))
+
+    input_file.write_text('changed')
+    third_shell = mocker.Mock(side_effect=touch_output)
+    with Session(shell=third_shell, disk_cache=cache) as s:
+        s.save(step, tmp_path / 'output3.txt')
+    assert [c.args[0][0] for c in third_shell.call_args_list] == ['cp', 'step', 'cp']
+
+
+def test_max_workers_defaults_to_cpu_count():
+    with Session(max_workers=None) as s:
+        assert s.max_workers == (os.cpu_count() or 1)
+
+
+def test_parallel_dependencies(mocker: MockFixture):
+    both_running = threading.Barrier(2, timeout=5)
+
+    def dependency(name):
+        d = mocker.MagicMock(spec=AbstractDataCommand)
+        d.preferred_suffix = ''
+        d.passthrough = None
+        d.estimated_cost = 1.0
+        d.command.side_effect = lambda output: (name, shared, output)
+        return d
+
+    shared = mocker.MagicMock(spec=AbstractDataCommand)
+    shared.preferred_suffix = ''
+    shared.passthrough = None
+    shared.estimated_cost = 1.0
+    shared.command.side_effect = lambda output: ('shared', output)
+    left = dependency('left')
+    right = dependency('right')
+    root = mocker.MagicMock(spec=AbstractDataCommand)
+    root.preferred_suffix = ''
+    root.passthrough = None
+    root.estimated_cost = 1.0
+    root.command.side_effect = lambda output: ('root', left, right, output)
+
+    def shell(cmd):
+        if cmd[0] in ('left', 'right'):
+            both_running.wait()
+    shell = mocker.Mock(side_effect=shell)
+
+    with Session(require_output=False, shell=shell, max_workers=2) as s:
+        s.save(root, 'output')
+
+    shared.command.assert_called_once()
+    names = [c.args[0][0] for c in shell.call_args_list]
+    assert names[0] == 'shared'
+    assert sorted(names[1:3]) == ['left', 'right']
+    assert names[3:] == ['root', 'cp']
+
+
+def test_parallel_critical_path_first(mocker: MockFixture):
+    def data(name, *dependencies):
+        d = mocker.MagicMock(spec=AbstractDataCommand)
+        d.preferred_suffix = ''
+        d.passthrough = None
+        d.estimated_cost = 1.0
+        d.command.side_effect = lambda output: (name, *dependencies, output)
+        return d
+
+    long_chain = data('a3', data('a2', data('a1')))
+    root = data('root', data('b'), data('c'), long_chain)
+
+    shell = mocker.Mock()
+    with Session(require_output=False, shell=shell, max_workers=2) as s:
+        s.save(root, 'output')
+
+    names = [c.args[0][0] for c in shell.call_args_list]
+    assert 'a1' in names[:2]
+    assert names.index('a1') < names.index('a2') < names.index('a3') < names.index('root')
+    assert names[-2:] == ['root', 'cp']
+
+
+def test_as_script(mocker: MockFixture):
+    leaf = mocker.MagicMock(spec=AbstractDataCommand)
+    leaf.preferred_suffix = ''
+    leaf.passthrough = None
+    leaf.command.side_effect = lambda output: ('leaf', output)
+    step = mocker.MagicMock(spec=AbstractDataCommand)
+    step.preferred_suffix = ''
+    step.passthrough = None
+    step.command.side_effect = lambda output: ('step', leaf, output)
+
+    scripts = []
+    shell = mocker.Mock(side_effect=lambda cmd: cmd[0] == 'bash' and scripts.append(cmd[2].read_text()))
+    with Session(require_output=False, shell=shell, as_script=True) as s:
+        s.save(step, 'output')
+
+    leaf_path, = leaf.command.call_args.args
+    step_path, = step.command.call_args.args
+    assert scripts == [f'leaf {leaf_path}\nstep {leaf_path} {step_path}\n']
+    script_call, cp_call = shell.call_args_list
+    assert script_call.args[0][:2] == ('bash', '-eu')
+    assert cp_call == mocker.call(('cp', '-rL', step_path, 'output'))
+
+
+def test_as_script_parallel_chains(mocker: MockFixture):
+    def data(name, *dependencies):
+        d = mocker.MagicMock(spec=AbstractDataCommand)
+        d.preferred_suffix = ''
+        d.passthrough = None
+        d.estimated_cost = 1.0
+        d.command.side_effect = lambda output: (name, *dependencies, output)
+        return d
+
+    root = data('root', data('a2', data('a1')), data('b2', data('b1')))
+
+    scripts = []
+
+    def shell(cmd):
+        if cmd[0] == 'bash':
+            scripts.append([line.split()[0] for line in cmd[2].read_text().splitlines()])
+
+    with Session(require_output=False, shell=shell, max_workers=2, as_script=True) as s:
+        s.save(root, 'output')
+
+    assert sorted(scripts) == [['a1', 'a2'], ['b1', 'b2'], ['root']]
+
+
+def test_concurrent_saves_do_not_deadlock(mocker: MockFixture):
+    def data(name, command):
+        d = mocker.MagicMock(spec=AbstractDataCommand)
+        d.preferred_suffix = ''
+        d.passthrough = None
+        d.estimated_cost = 1.0
+        d.command.side_effect = command
+        return d
+
+    q_planning = threading.Event()
+    p_planned = threading.Event()
+
+    def q_command(output):
+        # the first thread to plan q waits until the other thread has planned p
+        if not q_planning.is_set():
+            q_planning.set()
+            p_planned.wait(timeout=5)
+        return 'q', p, output
+
+    def p_command(output):
+        p_planned.set()
+        return 'p', output
+
+    p = data('p', p_command)
+    q = data('q', q_command)
+    a = data('a', lambda output: ('a', q, output))
+    b = data('b', lambda output: ('b', p, q, output))
+
+    shell = mocker.Mock()
+    with Session(require_output=False, shell=shell) as s:
+        threads = [threading.Thread(target=s.save, args=(x, output), daemon=True)
+                   for x, output in ((a, 'a'), (b, 'b'))]
+        threads[0].start()
+        q_planning.wait(timeout=5)
+        threads[1].start()
+        for t in threads:
+            t.join(timeout=5)
+        assert not any(t.is_alive() for t in threads)
+
+    names = [c.args[0][0] for c in shell.call_args_list]
+    assert sorted(names) == ['a', 'b', 'cp', 'cp', 'p', 'q']
+
+
+def test_parallel_concurrent_saves_do_not_deadlock(mocker: MockFixture):
+    def data(name, command):
+        d = mocker.MagicMock(spec=AbstractDataCommand)
+        d.preferred_suffix = ''
+        d.passthrough = None
+        d.estimated_cost = 1.0
+        d.command.side_effect = command
+        return d
+
+    r_planning = threading.Event()
+    p_planned = threading.Event()
+
+    def r_command(output):
+        # the first thread to plan r waits until the other thread has planned p
+        if not r_planning.is_set():
+            r_planning.set()
+            p_planned.wait(timeout=5)
+        return 'r', p, output
+
+    def p_command(output):
+        p_planned.set()
+        return 'p', output
+
+    p = data('p', p_command)
+    q = data('q', lambda output: ('q', p, output))
+    r = data('r', r_command)
+    a = data('a', lambda output: ('a', q, r, output))
+    # both steps waiting for the other thread are ready before p
+    b = data('b', lambda output: ('b', p, q, r, output))
+
+    shell = mocker.Mock()
+    with Session(require_output=False, shell=shell, max_workers=2) as s:
+        threads = [threading.Thread(target=s.save, args=(x, output), daemon=True)
+                   for x, output in ((a, 'a'), (b, 'b'))]
+        threads[0].start()
+        r_planning.wait(timeout=5)
+        threads[1].start()
+        for t in threads:
+            t.join(timeout=5)
+        assert not any(t.is_alive() for t in threads)
+
+    names = [c.args[0][0] for c in shell.call_args_list]
+    assert sorted(names) == ['a', 'b', 'cp', 'cp', 'p', 'q', 'r']
+
+
+
+def test_reflink(mocker: MockFixture):
+    mock_data = mocker.MagicMock(spec=AbstractDataCommand)
+    mock_data.preferred_suffix = ''
+    mock_data.passthrough = None
+    mock_data.command.return_value = ('one', 'two')
+
+    shell = mocker.Mock()
+    with Session(require_output=False, shell=shell, reflink=True) as s:
+        s.save(mock_data, 'output')
+        script = s.compile_to_script(mock_data, 'output')
+
+    cache_path, = mock_data.command.call_args.args
+    assert shell.call_args_list[-1] == mocker.call(('cp', '-rL', '--reflink=auto', cache_path, 'output'))
+    assert script == f'cp -rL --reflink=auto {cache_path} output\n'
@@ -0,0 +1,84 @@
+import subprocess as sp
+import threading
+import time
+
+import pytest
+
+from civet.shells import BatchRunner, PersistentBash
+
+
+def test_batch_runner_runs_in_parallel():
+    with BatchRunner(max_parallel=3) as shell:
+        threads = [threading.Thread(target=shell, args=(('sleep', '0.3'),)) for _ in range(3)]
+        start = time.monotonic()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.monotonic() - start
+    assert elapsed < 0.8
+
+
+def test_batch_runner_raises():
+    with BatchRunner(max_parallel=2) as shell:
+        shell(('true',))
+        with pytest.raises(sp.CalledProcessError):
+            shell(('sh', '-c', 'exit 3'))
+        with pytest.raises(FileNotFoundError):
+            shell(('this-program-does-not-exist',))
+
+
+@pytest.mark.filterwarnings('ignore::pytest.PytestUnhandledThreadExceptionWarning')
+def test_batch_runner_fails_jobs_if_dispatcher_fails(mocker):
+    mocker.patch.object(BatchRunner, '_finish', side_effect=RuntimeError('dispatcher failed'))
+    errors = []
+
+    def call(cmd):
+        try:
+            shell(cmd)
+        except RuntimeError as e:
+            errors.append(e)
+
+    with BatchRunner(max_parallel=2) as shell:
+        # the first one to finish breaks the dispatcher, the others are still running or queued
+        threads = [threading.Thread(target=call, args=(cmd,))
+                   for cmd in (('true',), ('sleep', '5'), ('sleep', '5'))]
+        start = time.monotonic()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=3)
+        assert time.monotonic() - start < 3
+        assert [str(e) for e in errors] == ['dispatcher failed'] * 3
+        with pytest.raises(RuntimeError, match='closed'):
+            shell(('true',))
+
+
+def test_persistent_bash(tmp_path):
+    with PersistentBash() as shell:
+        shell(('touch', tmp_path / 'a file'))
+        shell(('sh', '-c', 'echo $PPID > "$1"', 'sh', tmp_path / 'ppid'))
+        with pytest.raises(sp.CalledProcessError):
+            shell(('sh', '-c', 'exit 3'))
+        with pytest.raises(sp.CalledProcessError):
+            shell(('this-program-does-not-exist',))
+        shell(('sh', '-c', 'echo $PPID > "$1"', 'sh', tmp_path / 'ppid2'))
+    assert (tmp_path / 'a file').exists()
+    assert (tmp_path / 'ppid').read_text() == (tmp_path / 'ppid2').read_text()
+
+
+def test_persistent_bash_hides_status_pipe():
+    with PersistentBash() as shell:
+        # would be read as the status of this command, and the real status as that of the next one
+        shell(('bash', '-c', f'echo 5 >&{shell._status_w}; exit 0'))
+        with pytest.raises(sp.CalledProcessError) as e:
+            shell(('sh', '-c', 'exit 3'))
+        assert e.value.returncode == 3
+
+
+def test_persistent_bash_exited():
+    with PersistentBash() as shell:
+        with pytest.raises(ChildProcessError):
+            shell(('sh', '-c', 'kill -9 $PPID'))
+        with pytest.raises(ChildProcessError):
+            shell(('true',))
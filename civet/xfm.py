@@ -19,7 +19,7 @@ class Transformations(Enum):
     SHEARS = '-shears'
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Xfm(DataSource):
     """
     Represents a `.xfm` file created by `param2xfm`.
@@ -33,16 +33,40 @@ class Xfm(DataSource):
     y: float
     z: float
     preferred_suffix = '.xfm'
+    estimated_cost = 0.1
 
     def command(self, output: str | PathLike) -> Sequence[str | PathLike | AbstractDataCommand]:
         return 'param2xfm', self.transformation.value, str(self.x), str(self.y), str(self.z), output
 
 
+@dataclass(frozen=True, slots=True)
+class ConcatXfm(DataSource):
+    """
+    Represents a `.xfm` file created by `xfmconcat`, which applies the given
+    transformations one after another.
+    """
+
+    xfms: tuple[Xfm, ...]
+    preferred_suffix = '.xfm'
+    estimated_cost = 0.1
+
+    def command(self, output: str | PathLike) -> Sequence[str | PathLike | AbstractDataCommand]:
+        return 'xfmconcat', *self.xfms, output
+
+    @classmethod
+    def of(cls, first: 'Xfm | ConcatXfm', second: 'Xfm | ConcatXfm') -> 'ConcatXfm':
+        return cls(_xfms(first) + _xfms(second))
+
+
+def _xfms(xfm: Xfm | ConcatXfm) -> tuple[Xfm, ...]:
+    return xfm.xfms if isinstance(xfm, ConcatXfm) else (xfm,)
+
+
 TransformProgram = Literal['transform_objects', 'transform_volume']
 _T = TypeVar('_T', bound='TransformableMixin')
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class TransformableMixin(DataFile[_T], abc.ABC):
     @property
     @abc.abstractmethod
@@ -52,10 +76,22 @@ class TransformableMixin(DataFile[_T], abc.ABC):
         """
         ...
 
-    def append_xfm(self, xfm: Xfm) -> _T:
+    def append_xfm(self, xfm: Xfm | ConcatXfm) -> _T:
+        if (previous := getattr(self, '_appended_xfm', None)) is not None:
+            # transform the original object once by both transformations,
+            # instead of reading and writing the whole object again
+            subject, first = previous
+            return subject.append_xfm(ConcatXfm.of(first, xfm))
+
         def command(output: str | PathLike) -> Sequence[str | PathLike | AbstractDataCommand]:
             return self.transform_program, self, xfm, output
-        return self.create_command(command)
+        result = self.create_command(command)
+        if self.transform_program == 'transform_objects':
+            # transform_objects transforms points exactly, so transforming twice
+            # is the same as transforming once by the concatenated transformations.
+            # Each call to create_command defines a new class, so this is per step.
+            type(result)._appended_xfm = (self, xfm)
+        return result
 
     def flip_x(self) -> _T:
         """